@@ -1,17 +1,27 @@
+import csv
+import io
+import json
 import logging
+import os
 import sys
 import uuid
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 import numpy as np
 import pandas as pd
-from sklearn.cluster import KMeans
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+from sklearn.cluster import KMeans, MiniBatchKMeans
 from sklearn.decomposition import FactorAnalysis
 from sklearn.metrics import silhouette_score
-from sklearn.preprocessing import StandardScaler
+from sklearn.preprocessing import OneHotEncoder, StandardScaler
+from scipy import sparse
+from threadpoolctl import threadpool_limits
 
-from sqlalchemy import MetaData, Table
+from sqlalchemy import MetaData, Table, text
 from dotenv import load_dotenv
 
 ROOT_DIR = Path(__file__).resolve().parents[1]
@@ -40,6 +50,8 @@ TARGET_COLUMNS = [
     "saldo_atual",
 ]
 
+# ordem dos ratings (fonte única); a função SQL risco_score() usada pelas views do
+# dashboard é gerada a partir desta lista (risco_score_ddl, via run_sql_migrations)
 RISK_ORDER = [
     "AA",
     "A",
@@ -55,10 +67,35 @@ RISK_ORDER = [
     "G",
 ]
 RISK_MAP: Dict[str, int] = {name: idx for idx, name in enumerate(RISK_ORDER)}
+RISK_VALUE_SET = pa.array(RISK_ORDER)
+
+
+def risco_score_ddl() -> str:
+    """DDL de risco_score(TEXT): mesmo score de RISK_MAP, calculado no Postgres."""
+    cases = "\n".join(
+        "    WHEN '{}' THEN {}".format(name.replace("'", "''"), idx) for name, idx in RISK_MAP.items()
+    )
+    return (
+        "CREATE OR REPLACE FUNCTION risco_score(risco TEXT) RETURNS INTEGER\n"
+        "LANGUAGE sql IMMUTABLE AS $$\n"
+        "  SELECT CASE upper(trim(risco))\n"
+        f"{cases}\n"
+        "  END\n"
+        "$$"
+    )
+
+NUMERIC_FEATURES = ["risco_inicial_score", "cob_garantia", "atraso", "valor_contrato", "saldo_atual"]
 
 OUTPUT_DIR = ROOT_DIR / "analysis" / "output"
 OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
+_TABLE_CACHE: Dict[str, Table] = {}
+
+# busca de k: para após N valores de k consecutivos sem melhora do silhouette
+SEARCH_PATIENCE = 2
+# silhouette é O(n²); amostra limita custo de memória/tempo em perfis grandes
+SILHOUETTE_SAMPLE_SIZE = 2000
+
 
 def slugify(value: str) -> str:
     filtered = [c.lower() if c.isalnum() else "_" for c in value]
@@ -68,56 +105,97 @@ def slugify(value: str) -> str:
     return slug.strip("_") or "perfil"
 
 
-def load_source_dataframe(engine) -> pd.DataFrame:
-    query = f"""
-        SELECT {', '.join(TARGET_COLUMNS)}
+def write_csv(df: pd.DataFrame, path: Path) -> None:
+    # formatação feita em C++ pelo Arrow (bem mais rápida que DataFrame.to_csv)
+    pa_csv.write_csv(pa.Table.from_pandas(df, preserve_index=False), path)
+
+
+def load_perfis(engine) -> List[str]:
+    query = text(
+        """
+        SELECT DISTINCT cliente_perfil
         FROM clientes_carteira
         WHERE cliente_perfil IS NOT NULL
-    """
-    logger.info("Fetching data from clientes_carteira")
+        ORDER BY cliente_perfil
+        """
+    )
     with engine.connect() as conn:
-        df = pd.read_sql(query, conn)
-    logger.info("Fetched %d rows", len(df))
+        perfis = [row[0] for row in conn.execute(query)]
+    logger.info("Encontrados %d perfis em clientes_carteira", len(perfis))
+    return perfis
+
+
+def load_perfil_dataframe(engine, perfil: str) -> pd.DataFrame:
+    # filtro no banco: só as linhas do perfil ficam em memória de cada vez
+    query = text(
+        f"""
+        SELECT {', '.join(TARGET_COLUMNS)}
+        FROM clientes_carteira
+        WHERE cliente_perfil = :perfil
+        """
+    )
+    with engine.connect() as conn:
+        df = pd.read_sql(query, conn, params={"perfil": perfil}, dtype_backend="pyarrow")
+    logger.info("Perfil %s: %d linhas carregadas", perfil, len(df))
     return df
 
 
 def prepare_segment(df: pd.DataFrame) -> pd.DataFrame:
-    work = df.copy()
-    work["risco_inicial"] = work["risco_inicial"].str.upper().str.strip()
-    work["risco_inicial_score"] = work["risco_inicial"].map(RISK_MAP)
-    work["cob_garantia"] = pd.to_numeric(work["cob_garantia"], errors="coerce")
-    work["atraso"] = pd.to_numeric(work["atraso"], errors="coerce")
-    work["valor_contrato"] = pd.to_numeric(work["valor_contrato"], errors="coerce")
-    work["saldo_atual"] = pd.to_numeric(work["saldo_atual"], errors="coerce")
-    work["mod_bacen"] = work["mod_bacen"].fillna("DESCONHECIDO").astype(str).str.upper()
+    # normalização + lookup em kernels Arrow; index_in devolve a posição em RISK_ORDER
+    # (nulo para rating desconhecido)
+    risco = pc.utf8_trim_whitespace(pc.utf8_upper(pa.array(df["risco_inicial"], type=pa.string())))
+    risco_score = pc.index_in(risco, value_set=RISK_VALUE_SET)
+    # assign gera o novo frame direto, sem copy() prévio do segmento inteiro;
+    # numéricos (NUMERIC chega como decimal Arrow) são normalizados para float64
+    work = df.assign(
+        risco_inicial=risco.to_pandas().set_axis(df.index),
+        risco_inicial_score=risco_score.to_pandas().set_axis(df.index),
+        cob_garantia=pd.to_numeric(df["cob_garantia"], errors="coerce").astype(float),
+        atraso=pd.to_numeric(df["atraso"], errors="coerce").astype(float),
+        valor_contrato=pd.to_numeric(df["valor_contrato"], errors="coerce").astype(float),
+        saldo_atual=pd.to_numeric(df["saldo_atual"], errors="coerce").astype(float),
+        mod_bacen=df["mod_bacen"].fillna("DESCONHECIDO").astype(str).str.upper(),
+    )
     # drop rows missing the core numeric drivers
     work = work.dropna(subset=["risco_inicial_score", "cob_garantia", "atraso"])
     if work.empty:
         return work
-    work["risco_inicial_score"] = work["risco_inicial_score"].astype(int)
-    work["cob_garantia"] = work["cob_garantia"].astype(float)
-    work["atraso"] = work["atraso"].astype(float)
-    work["valor_contrato"] = work["valor_contrato"].fillna(work["valor_contrato"].median())
-    work["saldo_atual"] = work["saldo_atual"].fillna(work["saldo_atual"].median())
-    one_hot = pd.get_dummies(work["mod_bacen"], prefix="mod", dtype=float)
-    feature_cols = ["risco_inicial_score", "cob_garantia", "atraso", "valor_contrato", "saldo_atual"]
-    # Não duplicar as colunas - apenas adicionar one-hot
-    return pd.concat([work.reset_index(drop=True), one_hot.reset_index(drop=True)], axis=1)
-
-
-def choose_factor_components(feature_frame: pd.DataFrame) -> int:
-    n_features = feature_frame.shape[1]
-    n_samples = feature_frame.shape[0]
+    work = work.assign(
+        risco_inicial_score=work["risco_inicial_score"].astype(int),
+        cob_garantia=work["cob_garantia"].astype(float),
+        atraso=work["atraso"].astype(float),
+        valor_contrato=work["valor_contrato"].fillna(work["valor_contrato"].median()),
+        saldo_atual=work["saldo_atual"].fillna(work["saldo_atual"].median()),
+    )
+    return work.reset_index(drop=True)
+
+
+def build_feature_matrix(prepared: pd.DataFrame) -> Tuple[sparse.csr_matrix, List[str]]:
+    """Monta a matriz de features (numéricas + one-hot de mod_bacen) em formato esparso."""
+    encoder = OneHotEncoder(sparse_output=True, dtype=np.float32)
+    one_hot = encoder.fit_transform(prepared[["mod_bacen"]])
+    numeric = sparse.csr_matrix(prepared[NUMERIC_FEATURES].to_numpy(np.float32))
+    features = sparse.hstack([numeric, one_hot]).tocsr()
+    # get_feature_names_out(["mod"]) falha: o encoder foi ajustado com a coluna "mod_bacen"
+    feature_names = NUMERIC_FEATURES + [f"mod_{cat}" for cat in encoder.categories_[0]]
+    return features, feature_names
+
+
+def choose_factor_components(features) -> int:
+    n_features = features.shape[1]
+    n_samples = features.shape[0]
     max_components = max(1, min(5, n_features, n_samples - 1))
     return min(3, max_components)
 
 
-def run_factor_analysis(feature_frame: pd.DataFrame) -> Dict[str, np.ndarray]:
-    scaler = StandardScaler()
-    X_scaled = scaler.fit_transform(feature_frame)
-    n_components = choose_factor_components(feature_frame)
+def run_factor_analysis(features: sparse.csr_matrix) -> Dict[str, np.ndarray]:
+    # with_mean=False mantém a matriz esparsa; a FactorAnalysis centraliza os dados internamente
+    scaler = StandardScaler(with_mean=False)
+    X_scaled = scaler.fit_transform(features)
+    n_components = choose_factor_components(features)
     fa = FactorAnalysis(n_components=n_components, random_state=42)
-    factors = fa.fit_transform(X_scaled)
+    # FactorAnalysis não aceita entrada esparsa: densifica só o bloco já escalado (float32)
+    factors = fa.fit_transform(X_scaled.toarray()).astype(np.float32)
     loadings = fa.components_
     return {
         "scaled": X_scaled,
@@ -134,15 +212,23 @@ def pick_cluster_count(factors: np.ndarray) -> tuple[int, float]:
         return 1, 0.0
     best_k = 1
     best_score = 0.0
+    sample_size = min(SILHOUETTE_SAMPLE_SIZE, factors.shape[0])
+    stale = 0
     for k in range(2, max_k + 1):
-        km = KMeans(n_clusters=k, n_init=20, random_state=42)
+        # MiniBatchKMeans só na busca; o ajuste final em cluster_factors usa KMeans completo
+        km = MiniBatchKMeans(n_clusters=k, n_init=3, batch_size=1024, random_state=42)
         labels = km.fit_predict(factors)
         if len(set(labels)) < 2:
             continue
-        score = silhouette_score(factors, labels)
+        score = silhouette_score(factors, labels, sample_size=sample_size, random_state=42)
         if score > best_score:
             best_score = score
             best_k = k
+            stale = 0
+        else:
+            stale += 1
+            if stale >= SEARCH_PATIENCE:
+                break
     return best_k, best_score
 
 
@@ -155,34 +241,69 @@ def cluster_factors(factors: np.ndarray, n_clusters: int) -> Dict[str, Any]:
     labels = km.fit_predict(factors)
     silhouette = 0.0
     if len(set(labels)) > 1:
-        silhouette = float(silhouette_score(factors, labels))
+        sample_size = min(SILHOUETTE_SAMPLE_SIZE, factors.shape[0])
+        silhouette = float(silhouette_score(factors, labels, sample_size=sample_size, random_state=42))
     return {"labels": labels, "centers": km.cluster_centers_, "silhouette": silhouette}
 
 
 def summarize_clusters(df: pd.DataFrame, labels: np.ndarray) -> pd.DataFrame:
     df = df.copy()
     df["cluster"] = labels
-    
-    # Abordagem mais robusta: construir dicionário linha por linha
-    summary_data = []
-    for cluster_id in sorted(df["cluster"].unique()):
-        cluster_df = df[df["cluster"] == cluster_id]
-        
-        # Calcular médias como valores escalares
-        summary_data.append({
-            "cluster": int(cluster_id),
-            "total_clientes": int(cluster_df["cliente_id"].nunique()),
-            "risco_inicial_medio": round(cluster_df["risco_inicial_score"].mean(), 2),
-            "cobertura_media": round(cluster_df["cob_garantia"].mean(), 2),
-            "atraso_medio": round(cluster_df["atraso"].mean(), 2),
-            "valor_contrato_medio": round(cluster_df["valor_contrato"].mean(), 2),
-            "saldo_atual_medio": round(cluster_df["saldo_atual"].mean(), 2),
-        })
-    
-    summary = pd.DataFrame(summary_data)
+
+    # uma única passada vetorizada por cluster
+    summary = (
+        df.groupby("cluster", sort=True)
+        .agg(
+            total_clientes=("cliente_id", "nunique"),
+            risco_inicial_medio=("risco_inicial_score", "mean"),
+            cobertura_media=("cob_garantia", "mean"),
+            atraso_medio=("atraso", "mean"),
+            valor_contrato_medio=("valor_contrato", "mean"),
+            saldo_atual_medio=("saldo_atual", "mean"),
+        )
+        .round(2)
+        .reset_index()
+        .astype({"cluster": int, "total_clientes": int})
+    )
     return summary
 
 
+def _copy_records(conn, table_name: str, columns: List[str], records: List[Dict[str, Any]]) -> None:
+    """Carrega registros via COPY ... FROM STDIN usando a conexão psycopg2 da transação corrente."""
+    buf = io.StringIO()
+    writer = csv.writer(buf, delimiter="\t", quoting=csv.QUOTE_MINIMAL, lineterminator="\n")
+    for record in records:
+        row = []
+        for col in columns:
+            value = record.get(col)
+            if value is None:
+                row.append("")
+            elif isinstance(value, dict):
+                row.append(json.dumps(value))
+            else:
+                row.append(str(value))
+        writer.writerow(row)
+    buf.seek(0)
+    copy_sql = (
+        f"COPY {table_name} ({', '.join(columns)}) "
+        "FROM STDIN WITH (FORMAT csv, DELIMITER E'\\t', NULL '')"
+    )
+    cursor = conn.connection.cursor()
+    try:
+        cursor.copy_expert(copy_sql, buf)
+    finally:
+        cursor.close()
+
+
+def _get_tables(engine) -> Dict[str, Table]:
+    """Reflete as tabelas de versionamento uma única vez por processo."""
+    if not _TABLE_CACHE:
+        metadata = MetaData()
+        for name in ("cluster_run", "cluster_run_clientes", "cluster_run_resumo"):
+            _TABLE_CACHE[name] = Table(name, metadata, autoload_with=engine)
+    return _TABLE_CACHE
+
+
 def persist_cluster_run(
     engine,
     perfil: str,
@@ -192,10 +313,10 @@ def persist_cluster_run(
     factor_cols: List[str],
 ) -> uuid.UUID:
     run_id = uuid.uuid4()
-    metadata = MetaData()
-    cluster_run_table = Table("cluster_run", metadata, autoload_with=engine)
-    cluster_run_clientes_table = Table("cluster_run_clientes", metadata, autoload_with=engine)
-    cluster_run_resumo_table = Table("cluster_run_resumo", metadata, autoload_with=engine)
+    tables = _get_tables(engine)
+    cluster_run_table = tables["cluster_run"]
+    cluster_run_clientes_table = tables["cluster_run_clientes"]
+    cluster_run_resumo_table = tables["cluster_run_resumo"]
 
     feature_columns = metrics.get("feature_columns", [])
     parametros_payload = {
@@ -214,52 +335,30 @@ def persist_cluster_run(
         "agencia_nome",
         "carteira_nome",
         "linha",
-        "cluster",
         "risco_inicial",
-        "risco_inicial_score",
     ]
     factor_cols_present = [col for col in factor_cols if col in prepared.columns]
-    cliente_records = []
-    for row in prepared[client_cols + factor_cols_present].to_dict(orient="records"):
-        factor_scores = {
-            col: float(row[col])
-            for col in factor_cols_present
-            if col in row and pd.notna(row[col])
-        }
-        cliente_records.append(
-            {
-                "run_id": run_id,
-                "cliente_id": row.get("cliente_id"),
-                "cliente_perfil": row.get("cliente_perfil"),
-                "agencia_nome": row.get("agencia_nome"),
-                "carteira_nome": row.get("carteira_nome"),
-                "linha": row.get("linha"),
-                "cluster": int(row.get("cluster", 0)),
-                "risco_inicial": row.get("risco_inicial"),
-                "risco_inicial_score": (
-                    int(row.get("risco_inicial_score"))
-                    if row.get("risco_inicial_score") is not None
-                    and not pd.isna(row.get("risco_inicial_score"))
-                    else None
-                ),
-                "factors": factor_scores,
-            }
-        )
-
-    summary_records = []
-    for row in summary.to_dict(orient="records"):
-        summary_records.append(
-            {
-                "run_id": run_id,
-                "cluster": int(row["cluster"]),
-                "total_clientes": int(row["total_clientes"]),
-                "risco_inicial_medio": float(row["risco_inicial_medio"]),
-                "cobertura_media": float(row["cobertura_media"]),
-                "atraso_medio": float(row["atraso_medio"]),
-                "valor_contrato_medio": float(row["valor_contrato_medio"]),
-                "saldo_atual_medio": float(row["saldo_atual_medio"]),
-            }
-        )
+    factors_df = prepared[factor_cols_present].astype(float)
+    factors_json = factors_df.astype(object).where(factors_df.notna(), None).to_dict(orient="records")
+    clientes_df = prepared[client_cols].astype(object).where(prepared[client_cols].notna(), None)
+    risco_score = prepared["risco_inicial_score"].astype("Int64").astype(object)
+    cliente_records = clientes_df.assign(
+        run_id=run_id,
+        cluster=prepared["cluster"].astype(int),
+        risco_inicial_score=risco_score.where(risco_score.notna(), None),
+        factors=factors_json,
+    ).to_dict(orient="records")
+
+    summary_cols = [
+        "cluster",
+        "total_clientes",
+        "risco_inicial_medio",
+        "cobertura_media",
+        "atraso_medio",
+        "valor_contrato_medio",
+        "saldo_atual_medio",
+    ]
+    summary_records = summary[summary_cols].assign(run_id=run_id).to_dict(orient="records")
 
     run_row = {
         "run_id": run_id,
@@ -271,10 +370,41 @@ def persist_cluster_run(
 
     with engine.begin() as conn:
         conn.execute(cluster_run_table.insert(), run_row)
+        # volumes grandes: COPY evita o executemany linha a linha
         if cliente_records:
-            conn.execute(cluster_run_clientes_table.insert(), cliente_records)
+            _copy_records(
+                conn,
+                cluster_run_clientes_table.name,
+                [
+                    "run_id",
+                    "cliente_id",
+                    "cliente_perfil",
+                    "agencia_nome",
+                    "carteira_nome",
+                    "linha",
+                    "cluster",
+                    "risco_inicial",
+                    "risco_inicial_score",
+                    "factors",
+                ],
+                cliente_records,
+            )
         if summary_records:
-            conn.execute(cluster_run_resumo_table.insert(), summary_records)
+            _copy_records(
+                conn,
+                cluster_run_resumo_table.name,
+                [
+                    "run_id",
+                    "cluster",
+                    "total_clientes",
+                    "risco_inicial_medio",
+                    "cobertura_media",
+                    "atraso_medio",
+                    "valor_contrato_medio",
+                    "saldo_atual_medio",
+                ],
+                summary_records,
+            )
 
     return run_id
 
@@ -283,11 +413,8 @@ def ensure_minimum_samples(df: pd.DataFrame, threshold: int = 25) -> bool:
     return len(df) >= threshold
 
 
-def build_segment_outputs(
-    perfil: str,
-    df_segment: pd.DataFrame,
-    engine = None,
-) -> Optional[pd.DataFrame]:
+def compute_segment(perfil: str, df_segment: pd.DataFrame) -> Optional[Dict[str, Any]]:
+    """Etapa sem acesso ao banco (fatores, clusters e CSVs); segura para rodar em subprocesso."""
     if not ensure_minimum_samples(df_segment):
         logger.warning("Skipping perfil %s (only %d registros)", perfil, len(df_segment))
         return None
@@ -295,19 +422,8 @@ def build_segment_outputs(
     if prepared.empty or prepared.shape[0] < 5:
         logger.warning("Perfil %s sem dados suficientes após limpeza", perfil)
         return None
-    feature_cols = [
-        col
-        for col in prepared.columns
-        if (col.startswith("mod_") and col != "mod_bacen")
-        or col in {
-        "risco_inicial_score",
-        "cob_garantia",
-        "atraso",
-        "valor_contrato",
-        "saldo_atual",
-    }
-    ]
-    factors_payload = run_factor_analysis(prepared[feature_cols])
+    features, feature_cols = build_feature_matrix(prepared)
+    factors_payload = run_factor_analysis(features)
     factors = factors_payload["factors"]
     k, search_silhouette = pick_cluster_count(factors)
     cluster_payload = cluster_factors(factors, k)
@@ -327,9 +443,9 @@ def build_segment_outputs(
         "linha",
         "cluster",
     ] + [f"factor_{idx+1}" for idx in range(factors_payload["n_components"])]
-    prepared[prepared_output_cols].to_csv(detailed_path, index=False)
+    write_csv(prepared[prepared_output_cols], detailed_path)
     summary = summarize_clusters(prepared, labels)
-    summary.to_csv(summary_path, index=False)
+    write_csv(summary, summary_path)
     metrics = {
         "feature_columns": feature_cols,
         "n_components": factors_payload["n_components"],
@@ -337,9 +453,23 @@ def build_segment_outputs(
         "silhouette": cluster_payload.get("silhouette", 0.0),
         "search_silhouette": search_silhouette,
     }
+    return {
+        "perfil": perfil,
+        "prepared": prepared,
+        "summary": summary,
+        "metrics": metrics,
+        "factor_cols": [f"factor_{idx+1}" for idx in range(factors_payload["n_components"])],
+        "output_cols": prepared_output_cols,
+    }
+
+
+def persist_segment(segment: Dict[str, Any], engine=None) -> pd.DataFrame:
+    perfil = segment["perfil"]
+    prepared = segment["prepared"]
+    summary = segment["summary"]
+    metrics = segment["metrics"]
     if engine is not None:
-        factor_cols = [f"factor_{idx+1}" for idx in range(factors_payload["n_components"])]
-        run_id = persist_cluster_run(engine, perfil, prepared, summary, metrics, factor_cols)
+        run_id = persist_cluster_run(engine, perfil, prepared, summary, metrics, segment["factor_cols"])
         logger.info(
             "Perfil %s -> %d clusters (run_id=%s, silhouette=%.3f)",
             perfil,
@@ -349,30 +479,67 @@ def build_segment_outputs(
         )
     else:
         logger.info("Perfil %s -> %d clusters (não persistido)", perfil, summary.shape[0])
-    return prepared[prepared_output_cols]
+    return prepared[segment["output_cols"]]
+
+
+def build_segment_outputs(
+    perfil: str,
+    df_segment: pd.DataFrame,
+    engine = None,
+) -> Optional[pd.DataFrame]:
+    segment = compute_segment(perfil, df_segment)
+    if segment is None:
+        return None
+    return persist_segment(segment, engine)
 
 
 def aggregate_views(consolidated: pd.DataFrame, dimension: str, filename: str) -> None:
+    # drop_duplicates + size equivale ao nunique por grupo, numa única passada de hash
     view = (
-        consolidated.groupby([dimension, "cluster"])
-        .agg(total_clientes=("cliente_id", "nunique"))
-        .reset_index()
+        consolidated[[dimension, "cluster", "cliente_id"]]
+        .drop_duplicates()
+        .groupby([dimension, "cluster"], sort=False)
+        .size()
+        .reset_index(name="total_clientes")
         .sort_values(by="total_clientes", ascending=False)
     )
-    view.to_csv(OUTPUT_DIR / filename, index=False)
+    write_csv(view, OUTPUT_DIR / filename)
+
+
+def _init_worker() -> None:
+    # um thread de BLAS/OpenMP por processo: FactorAnalysis e KMeans já são
+    # multithread, e N processos x N threads disputariam os mesmos núcleos
+    threadpool_limits(limits=1)
 
 
 def main() -> None:
     engine = get_engine()
-    df = load_source_dataframe(engine)
-    if df.empty:
+    perfis = load_perfis(engine)
+    if not perfis:
         logger.error("Tabela clientes_carteira não retornou dados")
         return
     consolidated_rows: List[pd.DataFrame] = []
-    for perfil, grupo in df.groupby("cliente_perfil"):
-        result = build_segment_outputs(perfil, grupo, engine=engine)
-        if result is not None:
-            consolidated_rows.append(result)
+    # perfis são independentes: fatores/k-means rodam em paralelo e a gravação
+    # no Postgres fica no processo principal (engine não é compartilhada)
+    max_workers = int(os.getenv("SEGMENTATION_WORKERS", "0")) or os.cpu_count() or 1
+    # no máximo max_workers perfis em voo: o próximo só é lido do banco quando
+    # um termina, então só esses DataFrames ficam em memória ao mesmo tempo
+    pending_perfis = iter(perfis)
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker) as executor:
+        in_flight = set()
+        for perfil in pending_perfis:
+            in_flight.add(executor.submit(compute_segment, perfil, load_perfil_dataframe(engine, perfil)))
+            if len(in_flight) >= max_workers:
+                break
+        while in_flight:
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                perfil = next(pending_perfis, None)
+                if perfil is not None:
+                    in_flight.add(executor.submit(compute_segment, perfil, load_perfil_dataframe(engine, perfil)))
+                segment = future.result()
+                if segment is not None:
+                    consolidated_rows.append(persist_segment(segment, engine))
     if not consolidated_rows:
         logger.warning("Nenhum perfil gerou clusters")
         return
@@ -43,15 +43,13 @@ COLUMN_RENAME = {
 }
 
 
-def to_bool(v):
-    if pd.isna(v):
-        return None
-    if isinstance(v, bool):
-        return v
-    s = str(v).strip().lower()
-    if not s:
-        return None
-    return s in ('s', 'sim', 'y', 'yes', 'true', '1', 't')
+BOOL_TRUE_VALUES = {'s', 'sim', 'y', 'yes', 'true', '1', 't'}
+
+
+def to_bool(values: pd.Series) -> pd.Series:
+    normalized = values.astype(str).str.strip().str.lower()
+    result = normalized.isin(BOOL_TRUE_VALUES).astype(object)
+    return result.where(values.notna() & (normalized != ''), None)
 
 
 def get_engine():
@@ -71,7 +69,14 @@ def get_engine():
         'password': password,
         'dbname': db
     }
-    engine = create_engine('postgresql+psycopg2://', connect_args=connect_args)
+    engine = create_engine(
+        'postgresql+psycopg2://',
+        connect_args=connect_args,
+        # executemany: INSERT/UPSERT em lotes de 5000 (insertmanyvalues), UPDATE/DELETE via execute_batch
+        executemany_mode='values_plus_batch',
+        insertmanyvalues_page_size=5000,
+        executemany_batch_page_size=1000,
+    )
     return engine
 
 
@@ -80,29 +85,30 @@ def read_excel(path: Path) -> pd.DataFrame:
     if str(path).lower().endswith('.xls'):
         engine_name = 'xlrd'
     logger.info('Lendo arquivo %s com engine=%s', path, engine_name)
-    df = pd.read_excel(path, engine=engine_name)
+    df = pd.read_excel(path, engine=engine_name, dtype_backend='pyarrow')
     logger.info('Linhas lidas: %d, colunas: %d', len(df), len(df.columns))
     return df
 
 
 def clean_dataframe(df: pd.DataFrame) -> pd.DataFrame:
-    df = df.copy()
-
     # manter somente as colunas esperadas
     missing = [c for c in EXPECTED_COLUMNS if c not in df.columns]
     if missing:
         raise ValueError(f'Colunas ausentes no arquivo: {missing}')
 
-    df = df[EXPECTED_COLUMNS]
-
-    rename_map = {c: COLUMN_RENAME.get(c, c) for c in df.columns}
-    df.rename(columns=rename_map, inplace=True)
+    # a seleção + rename já produzem um frame próprio; sem copy() do arquivo inteiro
+    rename_map = {c: COLUMN_RENAME.get(c, c) for c in EXPECTED_COLUMNS}
+    df = df[EXPECTED_COLUMNS].rename(columns=rename_map)
 
     # trim strings
-    for col in df.select_dtypes(include=['object']).columns:
-        df[col] = df[col].apply(lambda x: x.strip() if isinstance(x, str) else x)
-
-    df['e_cooperado'] = df['e_cooperado'].apply(to_bool)
+    for col in [c for c in df.columns if pd.api.types.is_string_dtype(df[c].dtype)]:
+        try:
+            stripped = df[col].str.strip()
+        except AttributeError:  # coluna object sem strings (ex.: booleanos)
+            continue
+        df[col] = stripped.where(stripped.notna(), df[col])
+
+    df['e_cooperado'] = to_bool(df['e_cooperado'])
 
     # substituir strings vazias por None para evitar inserção de ""
     df = df.replace({"": None})
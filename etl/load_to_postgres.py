@@ -16,11 +16,14 @@ O script faz:
 import sys
 import os
 import logging
+import re
+from functools import lru_cache
 from pathlib import Path
 from typing import List
 
 import pandas as pd
-from sqlalchemy import create_engine, MetaData, Table, text, bindparam
+from sqlalchemy import create_engine, MetaData, Table, text
+from sqlalchemy.engine import URL
 from sqlalchemy.dialects.postgresql import insert
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
@@ -66,26 +69,29 @@ COLUMN_MAP = {
     'RISCOINICIAL': 'risco_inicial'
 }
 
+# lookup estático: nomes já normalizados mapeiam para si mesmos
+NORMALIZED_COLUMN_MAP = {**{c: c for c in COLUMN_MAP.values()}, **COLUMN_MAP}
+_COL_NAME_TRANSLATION = str.maketrans({' ': '_', '-': '_'})
+
+_NON_DIGIT = re.compile(r'\D')
+
 TARGET_TABLE = 'clientes_carteira'
 CHUNK_SIZE = 1000
+# views materializadas do dashboard (sql/create_views_dashboard.sql)
+DASHBOARD_VIEWS = ['mv_dashboard_agg', 'mv_dashboard_top_clientes']
+
+DATE_COLUMNS = ['cliente_nascimento', 'data_operacao', 'data_vencimento']
+NUMERIC_COLUMNS = ['renda_bruta', 'saldo_atual', 'saldo_provisao', 'valor_garantia', 'cob_garantia', 'taxa', 'valor_contrato']
 
 
 def normalize_col_name(name: str) -> str:
     # keep provided mapping case-sensitive keys handled; otherwise fallback to simple normalizing
-    if name in COLUMN_MAP:
-        return COLUMN_MAP[name]
-    n = name.strip().lower().replace(' ', '_')
-    n = n.replace('-', '_')
-    return n
+    return NORMALIZED_COLUMN_MAP.get(name) or name.strip().lower().translate(_COL_NAME_TRANSLATION)
 
 
-def clean_documento(v):
-    if pd.isna(v):
-        return None
-    s = str(v)
-    import re
-    digits = re.sub(r'\D', '', s)
-    return digits if digits else None
+def clean_documento(values: pd.Series) -> pd.Series:
+    digits = values.astype('string').str.replace(_NON_DIGIT, '', regex=True)
+    return digits.where(digits.str.len() > 0, None)
 
 
 def read_input_file(path: Path) -> pd.DataFrame:
@@ -103,74 +109,85 @@ def read_input_file(path: Path) -> pd.DataFrame:
         for enc in ('utf-8', 'latin-1'):
             try:
                 df = pd.read_csv(path, sep=sep, engine='python', decimal=decimal,
-                                 thousands=thousands, encoding=enc)
+                                 thousands=thousands, encoding=enc, dtype_backend='pyarrow')
                 break
             except UnicodeDecodeError:
                 continue
         if df is None:
             df = pd.read_csv(path, sep=sep, engine='python', decimal=decimal,
-                             thousands=thousands, encoding='utf-8', errors='ignore')
+                             thousands=thousands, encoding='utf-8', errors='ignore',
+                             dtype_backend='pyarrow')
     else:
         engine_name = 'xlrd' if lower == '.xls' else 'openpyxl'
-        df = pd.read_excel(path, engine=engine_name)
+        # strings em Arrow: strip/lower/replace rodam em kernels C++ em vez de objetos Python
+        df = pd.read_excel(path, engine=engine_name, dtype_backend='pyarrow')
     return df
 
 
-def to_bool(v):
-    if pd.isna(v):
-        return None
-    if isinstance(v, bool):
-        return v
-    s = str(v).strip().lower()
-    return s in ('s', 'sim', 'y', 'yes', 'true', '1', 't')
+BOOL_TRUE_VALUES = {'s', 'sim', 'y', 'yes', 'true', '1', 't'}
+
+
+def to_bool(values: pd.Series) -> pd.Series:
+    result = values.astype(str).str.strip().str.lower().isin(BOOL_TRUE_VALUES).astype(object)
+    return result.where(values.notna(), None)
 
 
 def convert_df(dfin: pd.DataFrame) -> pd.DataFrame:
-    df = dfin.copy()
-    # normalize columns
-    col_rename = {c: normalize_col_name(c) for c in df.columns}
-    df.rename(columns=col_rename, inplace=True)
+    # normalize columns (rename já devolve um novo frame; dispensa copy() prévio)
+    df = dfin.rename(columns=normalize_col_name)
 
     # strip whitespace from string columns
-    for c in df.select_dtypes(include=['object']).columns:
-        df[c] = df[c].apply(lambda x: x.strip() if isinstance(x, str) else x)
+    # object (leitura numpy) ou string Arrow (dtype_backend='pyarrow')
+    for c in [c for c in df.columns if pd.api.types.is_string_dtype(df[c].dtype)]:
+        try:
+            stripped = df[c].str.strip()
+        except AttributeError:  # coluna object sem strings (ex.: booleanos)
+            continue
+        # valores não-string (números, datas) voltam NaN em .str; preserva o original
+        df[c] = stripped.where(stripped.notna(), df[c])
 
     # clean documento
     if 'cliente_documento' in df.columns:
-        df['cliente_documento'] = df['cliente_documento'].apply(clean_documento)
+        df['cliente_documento'] = clean_documento(df['cliente_documento'])
 
     # ensure cliente_id exists, clean and deduplicate
     if 'cliente_id' in df.columns:
-        df = df[~df['cliente_id'].isna()].copy()
-        df['cliente_id'] = df['cliente_id'].astype(object).apply(lambda x: str(x).strip())
+        df = df[df['cliente_id'].notna()]
+        df = df.assign(cliente_id=df['cliente_id'].astype(object).apply(lambda x: str(x).strip()))
         df = df[df['cliente_id'] != '']
         df = df.drop_duplicates(subset=['cliente_id'], keep='last')
 
     # boolean
     if 'e_cooperado' in df.columns:
-        df['e_cooperado'] = df['e_cooperado'].apply(to_bool)
+        df['e_cooperado'] = to_bool(df['e_cooperado'])
 
-    # dates
-    for dcol in ['cliente_nascimento', 'data_operacao', 'data_vencimento']:
-        if dcol in df.columns:
-            try:
-                df[dcol] = pd.to_datetime(df[dcol], dayfirst=True, errors='coerce').dt.date
-            except Exception:
-                df[dcol] = pd.to_datetime(df[dcol], errors='coerce').dt.date
+    # dates (convertidas em bloco)
+    date_cols = [c for c in DATE_COLUMNS if c in df.columns]
+    if date_cols:
+        try:
+            parsed = df[date_cols].apply(pd.to_datetime, dayfirst=True, errors='coerce')
+        except Exception:
+            parsed = df[date_cols].apply(pd.to_datetime, errors='coerce')
+        df[date_cols] = parsed.apply(lambda s: s.dt.date)
 
-    # numeric conversions
-    for ncol in ['renda_bruta', 'saldo_atual', 'saldo_provisao', 'valor_garantia', 'cob_garantia', 'taxa', 'valor_contrato']:
-        if ncol in df.columns:
-            df[ncol] = pd.to_numeric(df[ncol], errors='coerce')
+    # numeric conversions (um único bloco em vez de uma atribuição por coluna)
+    # em colunas Arrow o coerce pode devolver NaN (não nulo) em double[pyarrow]; float64
+    # unifica NaN e nulo para que notnull()/fillna tratem ambos como ausentes
+    num_cols = [c for c in NUMERIC_COLUMNS if c in df.columns]
+    if num_cols:
+        df[num_cols] = df[num_cols].apply(pd.to_numeric, errors='coerce').astype('float64')
 
     # atraso and numeric ints
     if 'atraso' in df.columns:
-        df['atraso'] = pd.to_numeric(df['atraso'], errors='coerce').fillna(0).astype('Int64')
+        atraso = pd.to_numeric(df['atraso'], errors='coerce').astype('float64')
+        df['atraso'] = atraso.fillna(0).astype('Int64')
 
     return df
 
 
+@lru_cache(maxsize=1)
 def get_engine():
+    """Engine único por processo (pool reaproveitado entre chamadas/requests)."""
     user = os.getenv('PGUSER')
     password = os.getenv('PGPASSWORD')
     host = os.getenv('PGHOST', 'localhost')
@@ -187,7 +204,19 @@ def get_engine():
             'password': password,
             'dbname': db
         }
-        engine = create_engine('postgresql+psycopg2://', connect_args=connect_args)
+        engine = create_engine(
+            'postgresql+psycopg2://',
+            connect_args=connect_args,
+            # executemany: INSERT/UPSERT em lotes de 5000 (insertmanyvalues), UPDATE/DELETE via execute_batch
+            executemany_mode='values_plus_batch',
+            insertmanyvalues_page_size=5000,
+            executemany_batch_page_size=1000,
+            pool_size=10,
+            max_overflow=20,
+            pool_pre_ping=True,
+            pool_recycle=1800,
+            future=True,
+        )
         return engine
     except Exception as exc:
         # imprimir info ambiente útil sem a senha para depuração
@@ -198,6 +227,38 @@ def get_engine():
         raise
 
 
+def _pg_url(drivername: str) -> URL:
+    user = os.getenv('PGUSER')
+    password = os.getenv('PGPASSWORD')
+    host = os.getenv('PGHOST', 'localhost')
+    port = os.getenv('PGPORT', '5432')
+    db = os.getenv('PGDATABASE')
+    if not all([user, password, db]):
+        raise EnvironmentError('PGUSER, PGPASSWORD and PGDATABASE environment variables must be set')
+    return URL.create(
+        drivername,
+        username=user,
+        password=password,
+        host=host,
+        port=int(port) if str(port).isdigit() else None,
+        database=db,
+    )
+
+
+@lru_cache(maxsize=1)
+def get_async_engine():
+    """Engine assíncrona (asyncpg) para os endpoints web; criada uma vez por processo."""
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    return create_async_engine(
+        _pg_url('postgresql+asyncpg'),
+        pool_size=10,
+        max_overflow=20,
+        pool_pre_ping=True,
+        pool_recycle=1800,
+    )
+
+
 def ensure_profissao_dim(engine):
     """Cria a tabela dimensão de profissões se não existir."""
     create_sql = """
@@ -223,14 +284,14 @@ def upsert_profissoes(engine, nomes: List[str]):
         return {}
     unique_nomes = sorted({n for n in nomes if n and str(n).strip()})
     with engine.begin() as conn:
-        # Inserir ignorando conflitos
-        insert_sql = "INSERT INTO profissao_dim (nome) VALUES (:nome) ON CONFLICT (nome) DO NOTHING"
-        conn.execute(text(insert_sql), [{'nome': n} for n in unique_nomes])
-        # Buscar ids
-        sel = text("SELECT id, nome FROM profissao_dim WHERE nome IN :names").bindparams(
-            bindparam('names', expanding=True)
+        # Insere e retorna os ids numa única ida ao banco; o DO UPDATE no-op
+        # garante que nomes já existentes também apareçam no RETURNING
+        upsert_sql = text(
+            "INSERT INTO profissao_dim (nome) SELECT unnest(CAST(:names AS text[])) "
+            "ON CONFLICT (nome) DO UPDATE SET nome = EXCLUDED.nome "
+            "RETURNING id, nome"
         )
-        res = conn.execute(sel, {'names': unique_nomes}).mappings().all()
+        res = conn.execute(upsert_sql, {'names': unique_nomes}).mappings().all()
     mapping = {row['nome']: row['id'] for row in res}
     return mapping
 
@@ -242,6 +303,11 @@ def upsert_dataframe(engine, table_name: str, df: pd.DataFrame, chunk_size: int
     cols = [c.name for c in table.columns if c.name != 'created_at' and c.name != 'updated_at']
     insert_cols = [c for c in cols if c in df.columns]
 
+    # statement compilado uma vez; cada chunk vira um executemany (execute_values)
+    stmt = insert(table)
+    update_dict = {c: stmt.excluded[c] for c in insert_cols if c != 'cliente_id'}
+    stmt = stmt.on_conflict_do_update(index_elements=['cliente_id'], set_=update_dict)
+
     with engine.begin() as conn:
         for start in range(0, len(df), chunk_size):
             chunk = df.iloc[start:start+chunk_size]
@@ -250,13 +316,27 @@ def upsert_dataframe(engine, table_name: str, df: pd.DataFrame, chunk_size: int
             records = chunk_records.to_dict(orient='records')
             if not records:
                 continue
-            stmt = insert(table).values(records)
-            update_dict = {c: stmt.excluded[c] for c in insert_cols if c != 'cliente_id'}
-            stmt = stmt.on_conflict_do_update(index_elements=['cliente_id'], set_=update_dict)
-            conn.execute(stmt)
+            conn.execute(stmt, records)
             logger.info(f'Upserted rows %d..%d', start, start + len(records) - 1)
 
 
+def refresh_dashboard_views(engine):
+    """Atualiza as views materializadas do dashboard após a carga."""
+    # VACUUM não roda dentro de transação: conexão em autocommit. Além das
+    # estatísticas, atualiza o visibility map, sem o qual o index-only scan em
+    # idx_clientes_saldo_desc ainda buscaria cada linha no heap após o upsert
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        conn.execute(text(f'VACUUM (ANALYZE) {TARGET_TABLE}'))
+    with engine.begin() as conn:
+        for view in DASHBOARD_VIEWS:
+            exists = conn.execute(text('SELECT to_regclass(:name)'), {'name': view}).scalar()
+            if exists is None:
+                logger.warning('View %s não encontrada; execute scripts/run_sql_migrations.py', view)
+                continue
+            conn.execute(text(f'REFRESH MATERIALIZED VIEW CONCURRENTLY {view}'))
+            logger.info('View %s atualizada', view)
+
+
 def main(input_path: str):
     df = read_input_file(Path(input_path))
     logger.info('Linhas lidas: %d, colunas: %d', len(df), len(df.columns))
@@ -278,6 +358,7 @@ def main(input_path: str):
         dfc['profissao_id'] = dfc['profissao'].map(mapping).astype('Int64')
 
     upsert_dataframe(engine, TARGET_TABLE, dfc)
+    refresh_dashboard_views(engine)
     logger.info('Carga finalizada')
 
 
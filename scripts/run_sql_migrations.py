@@ -1,6 +1,7 @@
 """Execute todos os arquivos .sql do diretório sql/ em ordem alfabética."""
 from __future__ import annotations
 
+import hashlib
 import logging
 from pathlib import Path
 import sys
@@ -15,20 +16,47 @@ if str(ROOT_DIR) not in sys.path:
 
 load_dotenv(ROOT_DIR / ".env")
 
+from analysis.segmentation import risco_score_ddl  # noqa: E402  pylint: disable=wrong-import-position
 from etl.load_to_postgres import get_engine  # noqa: E402  pylint: disable=wrong-import-position
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
 logger = logging.getLogger(__name__)
 
 
-def apply_sql_file(engine, sql_path: Path) -> None:
-    logger.info("Aplicando script SQL: %s", sql_path.name)
+# controle de scripts já aplicados; o checksum permite reaplicar um arquivo
+# alterado (os scripts usam IF NOT EXISTS / OR REPLACE e são idempotentes)
+MIGRATIONS_DDL = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    filename TEXT PRIMARY KEY,
+    checksum TEXT NOT NULL,
+    applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+)
+"""
+
+RECORD_MIGRATION = text(
+    """
+    INSERT INTO schema_migrations (filename, checksum, applied_at)
+    VALUES (:filename, :checksum, now())
+    ON CONFLICT (filename) DO UPDATE
+        SET checksum = EXCLUDED.checksum,
+            applied_at = EXCLUDED.applied_at
+    """
+)
+
+
+def apply_sql_file(conn, sql_path: Path, applied: dict[str, str]) -> bool:
     sql_content = sql_path.read_text(encoding="utf-8")
     if not sql_content.strip():
-        logger.info("Arquivo vazio, pulando")
-        return
-    with engine.begin() as conn:
-        conn.exec_driver_sql(sql_content)
+        logger.info("Arquivo vazio, pulando: %s", sql_path.name)
+        return False
+    checksum = hashlib.sha256(sql_content.encode("utf-8")).hexdigest()
+    if applied.get(sql_path.name) == checksum:
+        logger.info("Já aplicado, pulando: %s", sql_path.name)
+        return False
+    logger.info("Aplicando script SQL: %s", sql_path.name)
+    conn.exec_driver_sql(sql_content)
+    conn.execute(RECORD_MIGRATION, {"filename": sql_path.name, "checksum": checksum})
+    return True
 
 
 def main() -> None:
@@ -42,9 +70,17 @@ def main() -> None:
         return
 
     engine = get_engine()
-    for script_path in scripts:
-        apply_sql_file(engine, script_path)
-    logger.info("Scripts executados com sucesso.")
+    # uma única transação: um commit só e tudo-ou-nada se algum script falhar
+    with engine.begin() as conn:
+        conn.exec_driver_sql(MIGRATIONS_DDL)
+        # serializa execuções concorrentes até o commit
+        conn.exec_driver_sql("LOCK TABLE schema_migrations IN EXCLUSIVE MODE")
+        applied = dict(conn.execute(text("SELECT filename, checksum FROM schema_migrations")).all())
+        # gerada de RISK_ORDER a cada execução (OR REPLACE, idempotente); precisa existir
+        # antes de create_views_dashboard.sql
+        conn.exec_driver_sql(risco_score_ddl())
+        count = sum(apply_sql_file(conn, script_path, applied) for script_path in scripts)
+    logger.info("Scripts executados com sucesso (%d aplicados).", count)
 
 
 if __name__ == "__main__":
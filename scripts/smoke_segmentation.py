@@ -0,0 +1,64 @@
+"""Smoke check de analysis.segmentation.compute_segment com um frame sintético (sem banco)."""
+from __future__ import annotations
+
+import os
+from pathlib import Path
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+# get_engine() só é chamado no main(); a importação não abre conexão
+os.environ.setdefault("PGUSER", "smoke")
+os.environ.setdefault("PGPASSWORD", "smoke")
+os.environ.setdefault("PGDATABASE", "smoke")
+
+from analysis import segmentation  # noqa: E402  pylint: disable=wrong-import-position
+
+
+def build_frame(n_rows: int = 60) -> pd.DataFrame:
+    rng = np.random.default_rng(42)
+    df = pd.DataFrame(
+        {
+            "cliente_id": [f"C{idx:04d}" for idx in range(n_rows)],
+            "cliente_nome": [f"Cliente {idx}" for idx in range(n_rows)],
+            "cliente_perfil": "PJ",
+            "agencia_nome": rng.choice(["Centro", "Norte"], n_rows),
+            "carteira_nome": "Carteira 1",
+            "linha": rng.choice(["Capital de giro", "Desconto"], n_rows),
+            "risco_inicial": rng.choice([" aa", "B", "c ", "D", "XX"], n_rows),
+            "cob_garantia": rng.uniform(0, 2, n_rows),
+            "mod_bacen": rng.choice(["0202", "0203", None], n_rows),
+            "atraso": rng.integers(0, 90, n_rows),
+            "valor_contrato": rng.uniform(1_000, 100_000, n_rows),
+            "saldo_atual": rng.uniform(0, 100_000, n_rows),
+        }
+    )
+    # mesmo backend de dtypes que load_perfil_dataframe devolve
+    return df.convert_dtypes(dtype_backend="pyarrow")
+
+
+def main() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        segmentation.OUTPUT_DIR = Path(tmp)
+        segment = segmentation.compute_segment("PJ", build_frame())
+        assert segment is not None, "compute_segment não devolveu resultado"
+        metrics = segment["metrics"]
+        n_features = len(segmentation.NUMERIC_FEATURES) + segment["prepared"]["mod_bacen"].nunique()
+        assert len(metrics["feature_columns"]) == n_features, metrics["feature_columns"]
+        assert segment["summary"].shape[0] == metrics["n_clusters"]
+        assert sorted(p.name for p in Path(tmp).iterdir()) == [
+            "perfil_pj_cluster_summary.csv",
+            "perfil_pj_clusters.csv",
+        ]
+    print(f"ok: {metrics['n_clusters']} clusters, features={metrics['feature_columns']}")
+
+
+if __name__ == "__main__":
+    main()
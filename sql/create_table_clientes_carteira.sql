@@ -50,6 +50,8 @@ CREATE INDEX IF NOT EXISTS idx_clientes_carteira_nome ON clientes_carteira (cart
 CREATE INDEX IF NOT EXISTS idx_clientes_atraso ON clientes_carteira (atraso);
 CREATE INDEX IF NOT EXISTS idx_clientes_risco_atual ON clientes_carteira (risco_atual);
 CREATE INDEX IF NOT EXISTS idx_clientes_data_operacao ON clientes_carteira (data_operacao);
+-- sem uso: risco_score() só roda no REFRESH das views (varredura completa); removido
+DROP INDEX IF EXISTS idx_clientes_risco_inicial_norm;
 
 -- GIN index para pesquisa em texto livre / extras
 CREATE INDEX IF NOT EXISTS idx_clientes_extras_gin ON clientes_carteira USING gin (extras);
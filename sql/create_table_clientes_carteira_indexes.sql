@@ -0,0 +1,9 @@
+-- Índices de apoio às views do dashboard (sql/create_views_dashboard.sql)
+-- Nome ordenado após create_table_clientes_carteira.sql pelo run_sql_migrations.py
+
+-- Top-N por saldo (mv_dashboard_top_clientes): mesma ordenação da view e todas as
+-- colunas projetadas no INCLUDE, permitindo index-only scan interrompido no LIMIT
+-- (depende do visibility map: o ETL roda VACUUM (ANALYZE) antes do REFRESH)
+CREATE INDEX IF NOT EXISTS idx_clientes_saldo_desc
+  ON clientes_carteira (saldo_atual DESC NULLS LAST)
+  INCLUDE (cliente_id, cliente_nome, carteira_nome, agencia_nome, atraso);
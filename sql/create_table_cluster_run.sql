@@ -35,6 +35,12 @@ CREATE TABLE IF NOT EXISTS cluster_run_resumo (
     PRIMARY KEY (run_id, cluster)
 );
 
-CREATE INDEX IF NOT EXISTS idx_cluster_run_perfil ON cluster_run (perfil);
+-- run mais recente por perfil (DISTINCT ON (perfil) ... ORDER BY perfil, run_at DESC);
+-- cobre também os filtros só por perfil, que usavam idx_cluster_run_perfil
+DROP INDEX IF EXISTS idx_cluster_run_perfil;
+CREATE INDEX IF NOT EXISTS idx_cluster_run_perfil_run_at ON cluster_run (perfil, run_at DESC);
 CREATE INDEX IF NOT EXISTS idx_cluster_run_clientes_cliente ON cluster_run_clientes (cliente_id);
 CREATE INDEX IF NOT EXISTS idx_cluster_run_clientes_cluster ON cluster_run_clientes (cluster);
+-- clientes de um cluster do run (WHERE run_id = ? AND cluster = ? ORDER BY cliente_id)
+CREATE INDEX IF NOT EXISTS idx_cluster_run_clientes_run_cluster ON cluster_run_clientes (run_id, cluster, cliente_id);
+-- cluster_run_resumo (run_id, cluster) já é coberto pela chave primária
@@ -0,0 +1,52 @@
+-- Views materializadas que alimentam o dashboard "Monitor de Carteiras" (web/app.py)
+-- Atualizadas ao final de cada carga do ETL (etl/load_to_postgres.py) via
+-- REFRESH MATERIALIZED VIEW CONCURRENTLY; o dashboard nunca lê clientes_carteira diretamente.
+
+-- risco_score(TEXT) (score numérico do rating) não é definida aqui: run_sql_migrations.py
+-- gera o CASE a partir de RISK_ORDER (analysis/segmentation.py) antes de aplicar este arquivo
+
+-- Roll-up por perfil, agência, carteira e linha + total geral (dimensao = 'total')
+-- Recriada quando este arquivo muda (run_sql_migrations reaplica pelo checksum)
+DROP MATERIALIZED VIEW IF EXISTS mv_dashboard_agg;
+CREATE MATERIALIZED VIEW mv_dashboard_agg AS
+SELECT
+  CASE GROUPING(cliente_perfil, agencia_nome, carteira_nome, linha)
+    WHEN 7 THEN 'perfil'
+    WHEN 11 THEN 'agencia'
+    WHEN 13 THEN 'carteira'
+    WHEN 14 THEN 'linha'
+    ELSE 'total'
+  END AS dimensao,
+  -- chave não nula por linha (o REFRESH CONCURRENTLY compara linhas pelo índice
+  -- único, e NULL nunca é igual a NULL): em cada grouping set só a coluna agrupada
+  -- é não nula, então o COALESCE devolve o valor do grupo; chave_nula separa o
+  -- grupo "sem valor" de um valor vazio ('')
+  COALESCE(cliente_perfil, agencia_nome, carteira_nome, linha, '') AS chave,
+  COALESCE(cliente_perfil, agencia_nome, carteira_nome, linha) IS NULL AS chave_nula,
+  cliente_perfil,
+  agencia_nome,
+  carteira_nome,
+  linha,
+  COALESCE(SUM(saldo_atual), 0) AS saldo_total,
+  COALESCE(SUM(valor_contrato), 0) AS valor_total,
+  AVG(valor_contrato) AS ticket_medio,
+  AVG(risco_score(risco_inicial)) AS risco_medio,
+  AVG((COALESCE(atraso, 0) > 0)::int) * 100 AS pct_atraso,
+  COUNT(*) AS total_contratos,
+  COUNT(DISTINCT cliente_id) AS total_clientes
+FROM clientes_carteira
+GROUP BY GROUPING SETS ((cliente_perfil), (agencia_nome), (carteira_nome), (linha), ());
+
+-- índice único exigido pelo REFRESH ... CONCURRENTLY
+CREATE UNIQUE INDEX IF NOT EXISTS ux_mv_dashboard_agg
+  ON mv_dashboard_agg (dimensao, chave, chave_nula);
+
+-- Maiores saldos (o dashboard exibe os 10 primeiros)
+CREATE MATERIALIZED VIEW IF NOT EXISTS mv_dashboard_top_clientes AS
+SELECT cliente_id, cliente_nome, carteira_nome, agencia_nome, saldo_atual, atraso
+FROM clientes_carteira
+ORDER BY saldo_atual DESC NULLS LAST
+LIMIT 50;
+
+CREATE UNIQUE INDEX IF NOT EXISTS ux_mv_dashboard_top_clientes
+  ON mv_dashboard_top_clientes (cliente_id);
@@ -1,12 +1,23 @@
+import asyncio
+import hmac
 import json
 import logging
+import os
 import sys
+import time
+import uuid
+from datetime import datetime
+from collections import OrderedDict
+from functools import wraps
 from pathlib import Path
 from typing import Dict, List, Optional
 
+import numpy as np
+import orjson
 import pandas as pd
-from flask import Flask, render_template, request, jsonify
+from quart import Quart, Response, render_template, request
 from dotenv import load_dotenv
+from sqlalchemy import text
 
 ROOT_DIR = Path(__file__).resolve().parents[1]
 if str(ROOT_DIR) not in sys.path:
@@ -14,12 +25,161 @@ if str(ROOT_DIR) not in sys.path:
 
 load_dotenv(ROOT_DIR / ".env")
 
-from etl.load_to_postgres import get_engine
+from etl.load_to_postgres import get_async_engine
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = Flask(__name__)
+app = Quart(__name__)
+
+
+class _LRUCache:
+    """Dict com limite de itens: ao passar de `maxsize`, descarta o menos usado.
+
+    Com `ttl` (segundos), entradas vencidas são removidas ao serem consultadas.
+    """
+
+    def __init__(self, maxsize: int, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+
+    def get(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value) -> None:
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+
+# cluster_run muda só quando a segmentação roda; a lista de runs vale por alguns
+# segundos. Resumo e fatores de um run_id são gravados numa única transação e
+# nunca mudam depois, então ficam em cache sem expiração, limitados aos
+# RUN_CACHE_MAXSIZE runs usados mais recentemente (ver /admin/flush-cache)
+RUNS_CACHE_TTL = int(os.getenv("CLUSTERS_CACHE_TTL", "60"))
+_runs_cache: Dict[str, tuple] = {}
+RUN_CACHE_MAXSIZE = 512
+_run_info_cache = _LRUCache(RUN_CACHE_MAXSIZE)
+_summary_cache = _LRUCache(RUN_CACHE_MAXSIZE)
+_characteristics_cache = _LRUCache(RUN_CACHE_MAXSIZE)
+# HTML das páginas de detalhe por request.path (dependem só de linhas imutáveis do run);
+# cada página de cluster traz a lista inteira de clientes, então o limite é baixo
+PAGE_CACHE_TTL = int(os.getenv("CLUSTERS_PAGE_CACHE_TTL", "300"))
+PAGE_CACHE_MAXSIZE = int(os.getenv("CLUSTERS_PAGE_CACHE_MAXSIZE", "64"))
+_page_cache = _LRUCache(PAGE_CACHE_MAXSIZE, ttl=PAGE_CACHE_TTL)
+# segredo exigido por /admin/flush-cache (header X-Admin-Token); sem ele a rota fica desativada
+CLUSTERS_ADMIN_TOKEN = os.getenv("CLUSTERS_ADMIN_TOKEN", "")
+
+
+SUMMARY_NUM_COLS = [
+    'risco_inicial_medio',
+    'cobertura_media',
+    'atraso_medio',
+    'valor_contrato_medio',
+    'saldo_atual_medio',
+]
+# colunas de _Q_SUMMARY (o DataFrame mantém o schema mesmo sem linhas)
+SUMMARY_COLUMNS = ['cluster', 'total_clientes'] + SUMMARY_NUM_COLS
+
+# linhas por lote lidas do cursor no servidor (clientes de um cluster)
+CLIENTS_STREAM_BATCH = 1000
+
+
+# consultas compiladas uma vez na importação; o asyncpg reaproveita o
+# prepared statement de cada uma entre requests
+_Q_ALL_RUNS = text("""
+    SELECT 
+        run_id,
+        perfil,
+        algoritmo,
+        COALESCE((parametros->>'n_clusters')::int, 0) AS n_clusters,
+        COALESCE((parametros->>'n_components')::int, 0) AS n_components,
+        COALESCE((metricas->>'silhouette')::float, 0.0) AS silhouette,
+        COALESCE((metricas->>'search_silhouette')::float, 0.0) AS search_silhouette,
+        run_at
+    FROM cluster_run
+    ORDER BY perfil, run_at DESC
+""")
+
+# DISTINCT ON no Postgres: só um run por perfil trafega (idx_cluster_run_perfil_run_at)
+_Q_LATEST_RUNS = text("""
+    SELECT DISTINCT ON (perfil)
+        run_id,
+        perfil,
+        COALESCE((parametros->>'n_clusters')::int, 0) AS n_clusters,
+        COALESCE((metricas->>'silhouette')::float, 0.0) AS silhouette,
+        to_char(run_at, 'DD/MM/YYYY HH24:MI') AS run_at_str
+    FROM cluster_run
+    ORDER BY perfil, run_at DESC
+""")
+
+_Q_RUN_INFO = text("""
+    SELECT
+        run_id,
+        perfil,
+        COALESCE((parametros->>'n_clusters')::int, 0) AS n_clusters,
+        COALESCE((parametros->>'n_components')::int, 0) AS n_components,
+        COALESCE((metricas->>'silhouette')::float, 0.0) AS silhouette,
+        to_char(run_at, 'DD/MM/YYYY HH24:MI:SS') AS run_at_str
+    FROM cluster_run
+    WHERE run_id = CAST(:run_id AS uuid)
+    LIMIT 1
+""")
+
+_Q_SUMMARY = text("""
+    SELECT 
+        cluster,
+        total_clientes,
+        risco_inicial_medio::float AS risco_inicial_medio,
+        cobertura_media::float AS cobertura_media,
+        atraso_medio::float AS atraso_medio,
+        valor_contrato_medio::float AS valor_contrato_medio,
+        saldo_atual_medio::float AS saldo_atual_medio
+    FROM cluster_run_resumo
+    WHERE run_id = CAST(:run_id AS uuid)
+    ORDER BY cluster
+""")
+
+_Q_CLIENTS = text("""
+    SELECT 
+        cliente_id,
+        cliente_perfil,
+        agencia_nome,
+        carteira_nome,
+        linha,
+        cluster,
+        risco_inicial,
+        risco_inicial_score,
+        factors
+    FROM cluster_run_clientes
+    WHERE run_id = CAST(:run_id AS uuid) AND cluster = :cluster_id
+    ORDER BY cliente_id
+""")
+
+# agregação no Postgres: só as médias (cluster x fator) trafegam pela rede
+_Q_FACTOR_MEANS = text("""
+    SELECT c.cluster, f.key AS fator, ROUND(AVG(f.value::float)::numeric, 3) AS media
+    FROM cluster_run_clientes c
+    CROSS JOIN LATERAL jsonb_each_text(c.factors) f
+    WHERE c.run_id = CAST(:run_id AS uuid)
+      AND jsonb_typeof(c.factors) = 'object'
+    GROUP BY c.cluster, f.key
+    ORDER BY c.cluster, f.key
+""")
 
 
 # Filtro personalizado para formatação de moeda
@@ -32,225 +192,251 @@ def currency_filter(value):
         return str(value)
 
 
-def get_all_runs() -> pd.DataFrame:
-    """Obtém todos os runs de clusterização ordenados por data."""
-    engine = get_engine()
-    query = """
-        SELECT 
-            run_id,
-            perfil,
-            algoritmo,
-            parametros->>'n_clusters' as n_clusters,
-            parametros->>'n_components' as n_components,
-            metricas->>'silhouette' as silhouette,
-            metricas->>'search_silhouette' as search_silhouette,
-            run_at
-        FROM cluster_run
-        ORDER BY perfil, run_at DESC
-    """
-    with engine.connect() as conn:
-        df = pd.read_sql(query, conn)
-    
-    # Converter tipos
-    df['n_clusters'] = pd.to_numeric(df['n_clusters'], errors='coerce').fillna(0).astype(int)
-    df['n_components'] = pd.to_numeric(df['n_components'], errors='coerce').fillna(0).astype(int)
-    df['silhouette'] = pd.to_numeric(df['silhouette'], errors='coerce').fillna(0.0)
-    df['search_silhouette'] = pd.to_numeric(df['search_silhouette'], errors='coerce').fillna(0.0)
-    
-    return df
-
-
-def get_cluster_summary(run_id: str) -> pd.DataFrame:
+def _orjson_default(obj):
+    # pd.Timestamp (subclasse de datetime) e o UUID do asyncpg não são serializados direto
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    if isinstance(obj, uuid.UUID):
+        return str(obj)
+    raise TypeError(f"Tipo não serializável: {type(obj)!r}")
+
+
+def ojsonify(obj, status: int = 200) -> Response:
+    """Equivalente ao jsonify usando orjson (fast path em C, numpy nativo)."""
+    body = orjson.dumps(obj, default=_orjson_default, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NAIVE_UTC)
+    return Response(body, status=status, mimetype='application/json')
+
+
+def cached_page(view):
+    """Guarda o HTML renderizado da view por `PAGE_CACHE_TTL` segundos (só respostas 200, até `PAGE_CACHE_MAXSIZE` páginas)."""
+    @wraps(view)
+    async def wrapper(*args, **kwargs):
+        cached = _page_cache.get(request.path)
+        if cached is not None:
+            return cached
+        result = await view(*args, **kwargs)
+        # erros e 404 voltam como tupla (corpo, status) e não entram no cache
+        if isinstance(result, str):
+            _page_cache.set(request.path, result)
+        return result
+    return wrapper
+
+
+async def _fetch_df(query, params: Optional[Dict] = None) -> pd.DataFrame:
+    """Executa a consulta no pool asyncpg e monta o DataFrame (NUMERIC -> float)."""
+    async with get_async_engine().connect() as conn:
+        result = await conn.execute(query, params or {})
+        return pd.DataFrame.from_records(result.all(), columns=list(result.keys()), coerce_float=True)
+
+
+async def _fetch_rows(query, params: Optional[Dict] = None) -> List[Dict]:
+    """Executa a consulta e devolve as linhas como dicts, sem passar pelo pandas."""
+    async with get_async_engine().connect() as conn:
+        result = await conn.execute(query, params or {})
+        return [dict(row) for row in result.mappings()]
+
+
+async def get_all_runs() -> List[Dict]:
+    """Obtém todos os runs de clusterização ordenados por data (lista compartilhada do cache)."""
+    cached = _runs_cache.get("runs")
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+    # tipos convertidos no SQL (::int / ::float); nada a coagir
+    rows = await _fetch_rows(_Q_ALL_RUNS)
+    _runs_cache["runs"] = (time.monotonic() + RUNS_CACHE_TTL, rows)
+    return rows
+
+
+async def get_latest_runs_per_perfil() -> pd.DataFrame:
+    """Obtém apenas o run mais recente de cada perfil."""
+    cached = _runs_cache.get("latest")
+    if cached and cached[0] > time.monotonic():
+        return cached[1].copy()
+    df = await _fetch_df(_Q_LATEST_RUNS)
+    _runs_cache["latest"] = (time.monotonic() + RUNS_CACHE_TTL, df)
+    return df.copy()
+
+
+def _is_uuid(value: str) -> bool:
+    try:
+        uuid.UUID(value)
+    except ValueError:
+        return False
+    return True
+
+
+async def get_run_info(run_id: str) -> Optional[pd.Series]:
+    """Obtém os dados de um único run pela chave primária (None se não existir)."""
+    if not _is_uuid(run_id):
+        return None
+    run_info = _run_info_cache.get(run_id)
+    if run_info is None:
+        df = await _fetch_df(_Q_RUN_INFO, {"run_id": run_id})
+        if df.empty:
+            return None
+        run_info = df.iloc[0]
+        _run_info_cache.set(run_id, run_info)
+    return run_info.copy()
+
+
+async def get_cluster_summary_rows(run_id: str) -> List[Dict]:
+    """Obtém o resumo dos clusters de um run como dicts (lista compartilhada do cache)."""
+    rows = _summary_cache.get(run_id)
+    if rows is None:
+        rows = await _fetch_rows(_Q_SUMMARY, {"run_id": run_id})
+        # run inexistente não entra no cache (evita crescer com ids arbitrários)
+        if rows:
+            _summary_cache.set(run_id, rows)
+    return rows
+
+
+async def get_cluster_summary(run_id: str) -> pd.DataFrame:
     """Obtém resumo de todos os clusters de um run específico."""
-    engine = get_engine()
-    query = f"""
-        SELECT 
-            cluster,
-            total_clientes,
-            risco_inicial_medio,
-            cobertura_media,
-            atraso_medio,
-            valor_contrato_medio,
-            saldo_atual_medio
-        FROM cluster_run_resumo
-        WHERE run_id = '{run_id}'::uuid
-        ORDER BY cluster
-    """
-    with engine.connect() as conn:
-        df = pd.read_sql(query, conn)
-    return df
+    rows = await get_cluster_summary_rows(run_id)
+    return pd.DataFrame.from_records(rows, columns=SUMMARY_COLUMNS)
 
 
-def get_cluster_clients(run_id: str, cluster_id: int) -> pd.DataFrame:
+async def get_cluster_clients(run_id: str, cluster_id: int) -> pd.DataFrame:
     """Obtém todos os clientes de um cluster específico."""
-    engine = get_engine()
-    query = f"""
-        SELECT 
-            cliente_id,
-            cliente_perfil,
-            agencia_nome,
-            carteira_nome,
-            linha,
-            cluster,
-            risco_inicial,
-            risco_inicial_score,
-            factors
-        FROM cluster_run_clientes
-        WHERE run_id = '{run_id}'::uuid AND cluster = {cluster_id}
-        ORDER BY cliente_id
-    """
-    with engine.connect() as conn:
-        df = pd.read_sql(query, conn)
-    return df
-
-
-def explain_cluster(summary_row: Dict) -> str:
-    """Gera uma explicação textual das características do cluster."""
-    explanations = []
-    
-    # Análise de risco
-    risco = summary_row['risco_inicial_medio']
-    if risco <= 2:
-        explanations.append("**Risco Baixo** (rating médio AA-B)")
-    elif risco <= 4:
-        explanations.append("**Risco Moderado** (rating médio BB-C)")
-    elif risco <= 7:
-        explanations.append("**Risco Elevado** (rating médio CC-D)")
-    else:
-        explanations.append("**Risco Muito Alto** (rating médio E-G)")
-    
-    # Análise de cobertura
-    cobertura = summary_row['cobertura_media']
-    if cobertura >= 150:
-        explanations.append("Excelente cobertura de garantias")
-    elif cobertura >= 100:
-        explanations.append("Cobertura adequada de garantias")
-    else:
-        explanations.append("Cobertura insuficiente de garantias")
-    
-    # Análise de atraso
-    atraso = summary_row['atraso_medio']
-    if atraso == 0:
-        explanations.append("Sem atrasos (adimplente)")
-    elif atraso <= 30:
-        explanations.append("Atrasos leves (até 30 dias)")
-    elif atraso <= 90:
-        explanations.append("Atrasos moderados (30-90 dias)")
-    else:
-        explanations.append("Atrasos graves (>90 dias)")
-    
-    # Análise de ticket
-    ticket = summary_row['valor_contrato_medio']
-    if ticket >= 100000:
-        explanations.append("Contratos de alto valor")
-    elif ticket >= 30000:
-        explanations.append("Contratos de médio valor")
-    else:
-        explanations.append("Contratos de baixo valor")
-    
-    return " • ".join(explanations)
-
-
-def get_cluster_characteristics(run_id: str, cluster_id: int) -> Dict:
-    """Analisa as características principais do cluster através dos fatores."""
-    engine = get_engine()
-    query = f"""
-        SELECT factors
-        FROM cluster_run_clientes
-        WHERE run_id = '{run_id}'::uuid AND cluster = {cluster_id}
-    """
-    with engine.connect() as conn:
-        df = pd.read_sql(query, conn)
-    
-    if df.empty:
-        return {}
-    
-    # Extrair médias dos fatores
-    all_factors = []
-    for factors_json in df['factors']:
-        if factors_json and isinstance(factors_json, dict):
-            all_factors.append(factors_json)
-    
-    if not all_factors:
-        return {}
-    
-    # Calcular médias dos fatores
-    factor_means = {}
-    for factor_dict in all_factors:
-        for key, value in factor_dict.items():
-            if key not in factor_means:
-                factor_means[key] = []
-            factor_means[key].append(value)
-    
-    result = {k: round(sum(v) / len(v), 3) for k, v in factor_means.items()}
+    # cursor no servidor: o DataFrame é montado por lotes, sem bufferizar o resultado
+    # inteiro no driver antes (pico de memória ~ um lote de linhas + o DataFrame)
+    async with get_async_engine().connect() as conn:
+        result = await conn.stream(_Q_CLIENTS, {"run_id": run_id, "cluster_id": cluster_id})
+        columns = list(result.keys())
+        frames = [
+            pd.DataFrame.from_records(batch, columns=columns, coerce_float=True)
+            async for batch in result.partitions(CLIENTS_STREAM_BATCH)
+        ]
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(frames, ignore_index=True)
+
+
+# Faixas das explicações automáticas. side='left' => valor <= limite cai na faixa
+# do limite; side='right' => valor >= limite já passa para a faixa seguinte
+_RISCO_BINS = np.array([2, 4, 7])
+_RISCO_LABELS = np.array([
+    "**Risco Baixo** (rating médio AA-B)",
+    "**Risco Moderado** (rating médio BB-C)",
+    "**Risco Elevado** (rating médio CC-D)",
+    "**Risco Muito Alto** (rating médio E-G)",
+])
+_COBERTURA_BINS = np.array([100, 150])
+_COBERTURA_LABELS = np.array([
+    "Cobertura insuficiente de garantias",
+    "Cobertura adequada de garantias",
+    "Excelente cobertura de garantias",
+])
+_ATRASO_BINS = np.array([0, 30, 90])
+_ATRASO_LABELS = np.array([
+    "Sem atrasos (adimplente)",
+    "Atrasos leves (até 30 dias)",
+    "Atrasos moderados (30-90 dias)",
+    "Atrasos graves (>90 dias)",
+])
+_TICKET_BINS = np.array([30000, 100000])
+_TICKET_LABELS = np.array([
+    "Contratos de baixo valor",
+    "Contratos de médio valor",
+    "Contratos de alto valor",
+])
+
+
+def explain_clusters(summary_df: pd.DataFrame) -> pd.Series:
+    """Gera a explicação textual de todos os clusters de uma vez (np.searchsorted por coluna)."""
+    risco = summary_df['risco_inicial_medio'].to_numpy(dtype=float)
+    cobertura = summary_df['cobertura_media'].to_numpy(dtype=float)
+    atraso = summary_df['atraso_medio'].to_numpy(dtype=float)
+    ticket = summary_df['valor_contrato_medio'].to_numpy(dtype=float)
+
+    # NaN vai para o fim no searchsorted; nas faixas ">=" ele precisa cair na primeira
+    risco_idx = np.searchsorted(_RISCO_BINS, risco, side='left')
+    cobertura_idx = np.where(np.isnan(cobertura), 0, np.searchsorted(_COBERTURA_BINS, cobertura, side='right'))
+    # só atraso exatamente zero é adimplente
+    atraso_idx = np.where(atraso == 0, 0, np.maximum(np.searchsorted(_ATRASO_BINS, atraso, side='left'), 1))
+    ticket_idx = np.where(np.isnan(ticket), 0, np.searchsorted(_TICKET_BINS, ticket, side='right'))
+
+    labels = pd.DataFrame({
+        'risco': _RISCO_LABELS[risco_idx],
+        'cobertura': _COBERTURA_LABELS[cobertura_idx],
+        'atraso': _ATRASO_LABELS[atraso_idx],
+        'ticket': _TICKET_LABELS[ticket_idx],
+    }, index=summary_df.index)
+    return labels['risco'].str.cat(labels[['cobertura', 'atraso', 'ticket']], sep=" • ")
+
+
+def summary_records(summary_df: pd.DataFrame) -> List[Dict]:
+    """Converte o resumo dos clusters em registros para os templates (arredondado por coluna)."""
+    df = summary_df.rename(columns={'cluster': 'cluster_id'})
+    df[SUMMARY_NUM_COLS] = df[SUMMARY_NUM_COLS].astype(float).round(2)
+    df['cluster_id'] = df['cluster_id'].astype(int)
+    df['total_clientes'] = df['total_clientes'].astype(int)
+    df['explicacao'] = explain_clusters(df)
+    return df.to_dict(orient='records')
+
+
+async def get_all_cluster_characteristics(run_id: str) -> Dict[int, Dict]:
+    """Obtém as médias dos fatores de todos os clusters de um run numa única consulta."""
+    characteristics = _characteristics_cache.get(run_id)
+    if characteristics is None:
+        characteristics = await _load_cluster_characteristics(run_id)
+        if characteristics:
+            _characteristics_cache.set(run_id, characteristics)
+    return {cluster: dict(means) for cluster, means in characteristics.items()}
+
+
+async def _load_cluster_characteristics(run_id: str) -> Dict[int, Dict]:
+    async with get_async_engine().connect() as conn:
+        rows = (await conn.execute(_Q_FACTOR_MEANS, {"run_id": run_id})).all()
+
+    result: Dict[int, Dict] = {}
+    for cluster, fator, media in rows:
+        result.setdefault(int(cluster), {})[fator] = float(media)
     return result
 
 
 @app.route('/')
-def index():
+async def index():
     """Página principal com lista de perfis e runs."""
     try:
-        runs_df = get_all_runs()
+        latest_runs = await get_latest_runs_per_perfil()
         
         # Converter run_id para string
-        runs_df['run_id'] = runs_df['run_id'].astype(str)
-        
-        # Agrupar por perfil, pegando o run mais recente
-        latest_runs = runs_df.groupby('perfil').first().reset_index()
+        latest_runs['run_id'] = latest_runs['run_id'].astype(str)
         latest_runs = latest_runs.sort_values('silhouette', ascending=False)
+        # data já formatada pelo Postgres (to_char)
+        latest_runs['run_at'] = latest_runs['run_at_str'].fillna('N/A')
         
-        perfis_data = []
-        for _, row in latest_runs.iterrows():
-            perfis_data.append({
-                'perfil': row['perfil'],
-                'run_id': str(row['run_id']),
-                'n_clusters': int(row['n_clusters']),
-                'silhouette': float(row['silhouette']),
-                'run_at': row['run_at'].strftime('%d/%m/%Y %H:%M') if pd.notna(row['run_at']) else 'N/A'
-            })
+        perfis_data = latest_runs[['perfil', 'run_id', 'n_clusters', 'silhouette', 'run_at']].to_dict(orient='records')
         
-        return render_template('clusters_index.html', perfis=perfis_data)
+        return await render_template('clusters_index.html', perfis=perfis_data)
     except Exception as e:
         logger.error(f"Erro ao carregar página principal: {e}", exc_info=True)
         return f"<h1>Erro ao carregar dados</h1><p>{str(e)}</p>", 500
 
 
 @app.route('/perfil/<run_id>')
-def perfil_detail(run_id: str):
+@cached_page
+async def perfil_detail(run_id: str):
     """Página de detalhes de um perfil com seus clusters."""
     try:
-        # Buscar informações do run
-        runs_df = get_all_runs()
-        # Converter run_id para string para comparação
-        runs_df['run_id'] = runs_df['run_id'].astype(str)
-        run_info = runs_df[runs_df['run_id'] == run_id]
-        
-        if run_info.empty:
+        if not _is_uuid(run_id):
             return f"<h1>Run não encontrado</h1><p>ID: {run_id}</p>", 404
         
-        run_info = run_info.iloc[0]
+        # run, resumo e fatores em paralelo, cada um numa conexão do pool
+        run_info, summary_df, factors_by_cluster = await asyncio.gather(
+            get_run_info(run_id),
+            get_cluster_summary(run_id),
+            get_all_cluster_characteristics(run_id),
+        )
         
-        # Buscar resumo dos clusters
-        summary_df = get_cluster_summary(run_id)
+        if run_info is None:
+            return f"<h1>Run não encontrado</h1><p>ID: {run_id}</p>", 404
         
-        clusters_data = []
-        for _, row in summary_df.iterrows():
-            cluster_data = {
-                'cluster_id': int(row['cluster']),
-                'total_clientes': int(row['total_clientes']),
-                'risco_inicial_medio': round(float(row['risco_inicial_medio']), 2),
-                'cobertura_media': round(float(row['cobertura_media']), 2),
-                'atraso_medio': round(float(row['atraso_medio']), 2),
-                'valor_contrato_medio': round(float(row['valor_contrato_medio']), 2),
-                'saldo_atual_medio': round(float(row['saldo_atual_medio']), 2),
-                'explicacao': explain_cluster(row.to_dict())
-            }
-            
+        clusters_data = summary_records(summary_df)
+        for cluster_data in clusters_data:
             # Adicionar características dos fatores
-            factors = get_cluster_characteristics(run_id, int(row['cluster']))
-            cluster_data['factors'] = factors
-            
-            clusters_data.append(cluster_data)
+            cluster_data['factors'] = factors_by_cluster.get(cluster_data['cluster_id'], {})
         
         perfil_data = {
             'perfil': run_info['perfil'],
@@ -258,94 +444,115 @@ def perfil_detail(run_id: str):
             'n_clusters': int(run_info['n_clusters']),
             'n_components': int(run_info['n_components']),
             'silhouette': round(float(run_info['silhouette']), 4),
-            'run_at': run_info['run_at'].strftime('%d/%m/%Y %H:%M:%S') if pd.notna(run_info['run_at']) else 'N/A'
+            'run_at': run_info['run_at_str'] or 'N/A'
         }
         
-        return render_template('perfil_detail.html', perfil=perfil_data, clusters=clusters_data)
+        return await render_template('perfil_detail.html', perfil=perfil_data, clusters=clusters_data)
     except Exception as e:
         logger.error(f"Erro ao carregar detalhes do perfil: {e}", exc_info=True)
         return f"<h1>Erro ao carregar dados</h1><p>{str(e)}</p>", 500
 
 
 @app.route('/cluster/<run_id>/<int:cluster_id>')
-def cluster_clients(run_id: str, cluster_id: int):
+@cached_page
+async def cluster_clients(run_id: str, cluster_id: int):
     """Página com lista de clientes de um cluster específico."""
     try:
-        # Buscar informações do run
-        runs_df = get_all_runs()
-        # Converter run_id para string para comparação
-        runs_df['run_id'] = runs_df['run_id'].astype(str)
-        run_info = runs_df[runs_df['run_id'] == run_id]
-        
-        if run_info.empty:
+        if not _is_uuid(run_id):
             return f"<h1>Run não encontrado</h1><p>ID: {run_id}</p>", 404
         
-        run_info = run_info.iloc[0]
+        # run, resumo e clientes em paralelo, cada um numa conexão do pool
+        run_info, summary_df, clients_df = await asyncio.gather(
+            get_run_info(run_id),
+            get_cluster_summary(run_id),
+            get_cluster_clients(run_id, cluster_id),
+        )
+        
+        if run_info is None:
+            return f"<h1>Run não encontrado</h1><p>ID: {run_id}</p>", 404
         
-        # Buscar resumo do cluster
-        summary_df = get_cluster_summary(run_id)
+        # Resumo do cluster
         cluster_summary = summary_df[summary_df['cluster'] == cluster_id]
         
         if cluster_summary.empty:
             return "<h1>Cluster não encontrado</h1>", 404
         
-        cluster_summary = cluster_summary.iloc[0]
-        
-        # Buscar clientes do cluster
-        clients_df = get_cluster_clients(run_id, cluster_id)
+        cluster_data = summary_records(cluster_summary)[0]
         
-        clients_data = []
-        for _, row in clients_df.iterrows():
-            factors = row['factors'] if isinstance(row['factors'], dict) else {}
-            clients_data.append({
-                'cliente_id': row['cliente_id'],
-                'agencia_nome': row['agencia_nome'],
-                'carteira_nome': row['carteira_nome'],
-                'linha': row['linha'],
-                'risco_inicial': row['risco_inicial'],
-                'risco_inicial_score': int(row['risco_inicial_score']) if pd.notna(row['risco_inicial_score']) else 'N/A',
-                'factors': factors
-            })
+        # coerções por coluna e um único to_dict (sem um Series por linha)
+        score = clients_df['risco_inicial_score'].astype('Int64')
+        clients_df['risco_inicial_score'] = score.astype(object).where(score.notna(), 'N/A')
+        clients_df['factors'] = clients_df['factors'].map(lambda f: f if isinstance(f, dict) else {})
+        clients_data = clients_df[
+            ['cliente_id', 'agencia_nome', 'carteira_nome', 'linha', 'risco_inicial', 'risco_inicial_score', 'factors']
+        ].to_dict(orient='records')
         
-        cluster_data = {
-            'cluster_id': cluster_id,
+        cluster_data.update({
             'perfil': run_info['perfil'],
             'run_id': run_id,
-            'total_clientes': int(cluster_summary['total_clientes']),
-            'risco_inicial_medio': round(float(cluster_summary['risco_inicial_medio']), 2),
-            'cobertura_media': round(float(cluster_summary['cobertura_media']), 2),
-            'atraso_medio': round(float(cluster_summary['atraso_medio']), 2),
-            'valor_contrato_medio': round(float(cluster_summary['valor_contrato_medio']), 2),
-            'saldo_atual_medio': round(float(cluster_summary['saldo_atual_medio']), 2),
-            'explicacao': explain_cluster(cluster_summary.to_dict())
-        }
+        })
         
-        return render_template('cluster_clients.html', cluster=cluster_data, clients=clients_data)
+        return await render_template('cluster_clients.html', cluster=cluster_data, clients=clients_data)
     except Exception as e:
         logger.error(f"Erro ao carregar clientes do cluster: {e}", exc_info=True)
         return f"<h1>Erro ao carregar dados</h1><p>{str(e)}</p>", 500
 
 
+@app.route('/admin/flush-cache', methods=['POST'])
+async def flush_cache():
+    """Descarta os caches em memória (ex.: após uma nova segmentação)."""
+    token = request.headers.get('X-Admin-Token', '')
+    if not CLUSTERS_ADMIN_TOKEN or not hmac.compare_digest(token.encode(), CLUSTERS_ADMIN_TOKEN.encode()):
+        return ojsonify({"error": "token de admin ausente ou inválido"}, 403)
+    _runs_cache.clear()
+    _run_info_cache.clear()
+    _summary_cache.clear()
+    _characteristics_cache.clear()
+    _page_cache.clear()
+    return ojsonify({"status": "ok"})
+
+
 @app.route('/api/runs')
-def api_runs():
+async def api_runs():
     """API endpoint para obter todos os runs."""
     try:
-        runs_df = get_all_runs()
-        return jsonify(runs_df.to_dict(orient='records'))
+        return ojsonify(await get_all_runs())
     except Exception as e:
         logger.error(f"Erro na API de runs: {e}", exc_info=True)
-        return jsonify({"error": str(e)}), 500
+        return ojsonify({"error": str(e)}, 500)
+
+
+@app.route('/api/cluster_clients/<run_id>/<int:cluster_id>')
+async def api_cluster_clients(run_id: str, cluster_id: int):
+    """API endpoint com os clientes de um cluster, enviados em lotes (cursor no servidor)."""
+    if not _is_uuid(run_id):
+        return ojsonify({"error": f"run_id inválido: {run_id}"}, 400)
+
+    async def generate():
+        # memória O(lote): as linhas vêm do cursor do servidor e saem já serializadas
+        yield b"["
+        first = True
+        async with get_async_engine().connect() as conn:
+            result = await conn.stream(_Q_CLIENTS, {"run_id": run_id, "cluster_id": cluster_id})
+            async for batch in result.mappings().partitions(CLIENTS_STREAM_BATCH):
+                chunk = b",".join(orjson.dumps(dict(row)) for row in batch)
+                yield chunk if first else b"," + chunk
+                first = False
+        yield b"]"
+
+    return Response(generate(), mimetype='application/json')
 
 
 @app.route('/api/cluster_summary/<run_id>')
-def api_cluster_summary(run_id: str):
+async def api_cluster_summary(run_id: str):
     """API endpoint para obter resumo dos clusters de um run."""
+    if not _is_uuid(run_id):
+        return ojsonify({"error": f"run_id inválido: {run_id}"}, 400)
     try:
-        summary_df = get_cluster_summary(run_id)
-        return jsonify(summary_df.to_dict(orient='records'))
+        return ojsonify(await get_cluster_summary_rows(run_id))
     except Exception as e:
         logger.error(f"Erro na API de cluster summary: {e}", exc_info=True)
-        return jsonify({"error": str(e)}), 500
+        return ojsonify({"error": str(e)}, 500)
 
 
 if __name__ == '__main__':